@@ -0,0 +1,52 @@
+import time
+from typing import Optional
+
+
+class OpenSongAdmission:
+    """
+    Admission control for new client connections.
+    A connection is only admitted when the maximum number of connections is not reached and the accept rate allows it.
+    The accept rate is limited using a token bucket, allowing a burst of connections (e.g. after a Wi-Fi reconnect)
+    while limiting the sustained rate. An accept rate of 0 disables rate limiting.
+    """
+    refused_max_connections = "max_connections"
+    refused_accept_rate = "accept_rate"
+
+    def __init__(self, max_connections: int, accept_rate: float, accept_burst: int,
+                 full_retry_after: int = 60, now: Optional[float] = None):
+        self.max_connections = max_connections
+        self.accept_rate = accept_rate
+        self.accept_burst = accept_burst
+        self.full_retry_after = full_retry_after
+        self._tokens: float = float(accept_burst)
+        self._last_refill: float = now if now is not None else time.monotonic()
+        self.rejected_connections: int = 0
+        self.refused_reason: Optional[str] = None
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(float(self.accept_burst), self._tokens + elapsed * self.accept_rate)
+        self._last_refill = now
+
+    def try_admit(self, active_connections: int, now: Optional[float] = None) -> bool:
+        self._refill(now if now is not None else time.monotonic())
+
+        if active_connections >= self.max_connections:
+            self.refused_reason = self.refused_max_connections
+        elif self.accept_rate > 0 and self._tokens < 1:
+            self.refused_reason = self.refused_accept_rate
+        else:
+            self.refused_reason = None
+            if self.accept_rate > 0:
+                self._tokens -= 1
+            return True
+
+        self.rejected_connections += 1
+        return False
+
+    def retry_after(self) -> int:
+        if self.refused_reason == self.refused_max_connections:
+            # Capacity only frees up when connections are closed or evicted, so back off longer
+            return self.full_retry_after
+        return max(1, int((1 - self._tokens) / self.accept_rate + 0.999))
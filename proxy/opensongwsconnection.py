@@ -1,13 +1,18 @@
 import asyncio
+import time
 import websockets
 from functools import partial
-from typing import Optional
+from typing import Optional, List, Tuple, Union
 from websockets.exceptions import ConnectionClosed
 from .proxyconfig import ProxyConfig
 from .opensongwsclient import OpenSongWsClient
 from .opensongendpoint import OpenSongEndpoint
 
 
+def data_size(data: Union[str, bytes]) -> int:
+    return len(data.encode()) if type(data) is str else len(data)
+
+
 class OpenSongWsConnection:
     _allowed_endpoints = [
         OpenSongEndpoint("/presentation/status"),
@@ -38,7 +43,79 @@ class OpenSongWsConnection:
         self.config = config
         self._shutdown = False
         self._subscribed = False
-        self._last_requested_endpoint: Optional[OpenSongEndpoint] = None
+        self.last_activity: float = time.monotonic()
+
+        # FIFO list of requests in flight, as (endpoint, expiry timer, size), until the response is delivered
+        self._pending_requests: List[Tuple[OpenSongEndpoint, asyncio.TimerHandle, int]] = []
+
+        # Accounting of the memory held by this connection, for requests in flight and responses not yet sent
+        self.pending_request_bytes: int = 0
+        self.buffered_bytes: int = 0
+        self.dropped_messages: int = 0
+
+    @property
+    def memory_usage(self) -> int:
+        return self.pending_request_bytes + self.buffered_bytes
+
+    @property
+    def pending_requests(self) -> int:
+        return len(self._pending_requests)
+
+    def _add_pending_request(self, endpoint: OpenSongEndpoint):
+        size = data_size(endpoint.url)
+        expire_timer = asyncio.get_event_loop().call_later(self.config.request_timeout,
+                                                           self._expire_pending_request, endpoint)
+        self._pending_requests.append((endpoint, expire_timer, size))
+        self.pending_request_bytes += size
+
+    def _remove_pending_request(self, index: int) -> OpenSongEndpoint:
+        endpoint, expire_timer, size = self._pending_requests.pop(index)
+        expire_timer.cancel()
+        self.pending_request_bytes -= size
+        return endpoint
+
+    def _expire_pending_request(self, expired_endpoint: OpenSongEndpoint):
+        for index, (endpoint, _, _) in enumerate(self._pending_requests):
+            if endpoint is expired_endpoint:
+                self._remove_pending_request(index)
+                self.config.logger.warning("No response received for '%s' in time" % endpoint.url)
+                self._forward(self._websocket, "The requested resource did not respond")
+                break
+
+    def _get_pending_request(self, binary: bool, resource: str = None, action: str = None,
+                             identifier: str = None) -> Optional[OpenSongEndpoint]:
+        for index, (endpoint, _, _) in enumerate(self._pending_requests):
+            if endpoint.expect_binary_response() == binary and \
+                    endpoint.matches_endpoint(resource, action, identifier):
+                return self._remove_pending_request(index)
+        return None
+
+    def _forward(self, websocket: websockets.WebSocketServerProtocol, data: Union[str, bytes],
+                 broadcast: bool = False):
+        size = data_size(data)
+        if self.buffered_bytes and self.buffered_bytes + size > self.config.max_buffered_bytes:
+            self.dropped_messages += 1
+            if broadcast:
+                # A next broadcast supersedes this one, so it can be dropped for a client that does not keep up
+                self.config.logger.warning("Dropped broadcast of %d bytes for slow client, %d bytes buffered" %
+                                           (size, self.buffered_bytes))
+            else:
+                # The client would wait for this response forever, let it reconnect instead
+                self.config.logger.warning("Closing slow client connection, %d bytes buffered" %
+                                           self.buffered_bytes)
+                asyncio.ensure_future(websocket.close(code=1013, reason="Too much data buffered"))
+            return
+
+        def _sent(future: asyncio.Future):
+            self.buffered_bytes -= size
+            if not future.cancelled() and future.exception():
+                # Retrieve the exception, the client disconnecting is handled by the receive loop
+                self.config.logger.debug("Failed to send %d bytes to client connection: %s" %
+                                         (size, str(future.exception())))
+
+        self.buffered_bytes += size
+        send_future = asyncio.ensure_future(websocket.send(data))
+        send_future.add_done_callback(_sent)
 
     async def _client_on_response_callback(self, websocket: websockets.WebSocketServerProtocol, response: str,
                                            resource: str = None, action: str = None, identifier: str = None):
@@ -46,15 +123,10 @@ class OpenSongWsConnection:
                                 (resource or "", action or "", identifier or "",
                                  response if len(response) < 1000 else response[:1000] + "..."))
 
-        forward_future = lambda: asyncio.ensure_future(websocket.send(response))
-
-        if self._subscribed and (resource, action) == ("presentation", "status"):
-            asyncio.get_event_loop().call_soon(forward_future)
-        elif self._last_requested_endpoint and \
-                not self._last_requested_endpoint.expect_binary_response() and \
-                self._last_requested_endpoint.matches_endpoint(resource, action, identifier):
-            asyncio.get_event_loop().call_soon(forward_future)
-            self._last_requested_endpoint = None
+        if self._get_pending_request(False, resource, action, identifier):
+            asyncio.get_event_loop().call_soon(partial(self._forward, websocket, response))
+        elif self._subscribed and (resource, action) == ("presentation", "status"):
+            asyncio.get_event_loop().call_soon(partial(self._forward, websocket, response, True))
         else:
             # Ignore the response for this connection
             pass
@@ -64,13 +136,8 @@ class OpenSongWsConnection:
         self.config.logger.info("Callback image on %s/%s/%s: %d bytes" %
                                 (resource or "", action or "", identifier or "", len(image)))
 
-        forward_future = lambda: asyncio.ensure_future(websocket.send(image))
-
-        if self._last_requested_endpoint and \
-                self._last_requested_endpoint.expect_binary_response() and \
-                self._last_requested_endpoint.matches_endpoint(resource, action, identifier):
-            asyncio.get_event_loop().call_soon(forward_future)
-            self._last_requested_endpoint = None
+        if self._get_pending_request(True, resource, action, identifier):
+            asyncio.get_event_loop().call_soon(partial(self._forward, websocket, image))
         else:
             # Ignore the response for this connection
             pass
@@ -87,19 +154,26 @@ class OpenSongWsConnection:
             if endpoint.resource == "ws":
                 if resource == "/ws/subscribe/presentation":
                     self._subscribed = True
-                    await self._websocket.send("OK")
+                    self._forward(self._websocket, "OK")
                     supported = True
                 elif resource == "/ws/unsubscribe/presentation":
                     self._subscribed = False
-                    await self._websocket.send("OK")
+                    self._forward(self._websocket, "OK")
                     supported = True
             else:
+                if len(self._pending_requests) >= self.config.max_pending_requests:
+                    self.config.logger.warning("Too many pending requests on client connection, ignoring '%s'" %
+                                               endpoint.url)
+                    self._forward(self._websocket, "Too many pending requests")
+                    return
+
+                # The request is in flight until its response is delivered, which is scheduled by the client
                 if await client.request_resource(endpoint):
-                    self._last_requested_endpoint = endpoint
+                    self._add_pending_request(endpoint)
                     supported = True
 
         if not supported:
-            await self._websocket.send("The requested resource could not be found")
+            self._forward(self._websocket, "The requested resource could not be found")
 
     async def run(self, client: OpenSongWsClient):
         response_callback = partial(self._client_on_response_callback, self._websocket)
@@ -110,10 +184,18 @@ class OpenSongWsConnection:
 
         while not self._shutdown:
             try:
-                resource = await self._websocket.recv()
+                # Without idle timeout (None) this waits until the client sends or disconnects
+                resource = await asyncio.wait_for(self._websocket.recv(), self.config.idle_timeout)
+                self.last_activity = time.monotonic()
                 if resource:
-                    handler = lambda: asyncio.ensure_future(self.process_request(resource, client))
-                    asyncio.get_event_loop().call_soon(handler)
+                    # Processed inline, as requesting a resource does not wait for the response of OpenSong
+                    await self.process_request(resource, client)
+            except asyncio.TimeoutError:
+                # Subscribed clients only receive, their liveness is verified by the websocket heartbeat
+                if not self._subscribed:
+                    self.config.logger.info("Closing client connection idle for %d seconds" %
+                                            (time.monotonic() - self.last_activity))
+                    self._shutdown = True
             except ConnectionClosed:
                 self._shutdown = True
             except Exception as e:
@@ -122,5 +204,8 @@ class OpenSongWsConnection:
         client.unregister_response_callback(response_callback)
         client.unregister_image_callback(image_callback)
 
+        while self._pending_requests:
+            self._remove_pending_request(0)
+
     def stop(self):
         self._shutdown = True
@@ -2,89 +2,144 @@ import asyncio
 import websockets
 from websockets.http import Headers as HTTPHeaders
 from http import HTTPStatus
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
 from .proxyconfig import ProxyConfig
 from .opensongwsclient import OpenSongWsClient
-from .opensongwsconnection import OpenSongWsConnection
+from .opensongwsconnection import OpenSongWsConnection, data_size
 from .opensongendpoint import OpenSongEndpoint
+from .opensongadmission import OpenSongAdmission
 
 HTTPResponse = Tuple[HTTPStatus, HTTPHeaders, bytes]
 
 
 class OpenSongWsServer:
+    # Clients only send resource urls, larger messages are refused by the websocket protocol
+    _max_message_size = 4096
+
     def __init__(self, config: ProxyConfig, client: OpenSongWsClient):
         self.config = config
         self._client = client
         self._server: Optional[websockets.serve] = None
         self._connections: List[OpenSongWsConnection] = []
-        self._response_queue = asyncio.Queue(loop=asyncio.get_event_loop())
+        # A full server only gets capacity back as idle connections are evicted, scale the back-off with that
+        self._admission = OpenSongAdmission(config.max_connections, config.accept_rate, config.accept_burst,
+                                            full_retry_after=max(30, (config.idle_timeout or 120) // 4))
+        # HTTP requests waiting for their response, responses are only kept while a request waits for them
+        self._waiting_requests: List[Tuple[OpenSongEndpoint, asyncio.Future]] = []
         self._client.register_response_callback(self._client_on_response_callback)
         self._client.register_image_callback(self._client_on_image_callback)
 
+    def _deliver_response(self, response: Union[str, bytes],
+                          resource: str = None, action: str = None, identifier: str = None):
+        for endpoint, response_future in self._waiting_requests:
+            if not response_future.done() and endpoint.matches_endpoint(resource, action, identifier):
+                response_future.set_result(response)
+
     async def _client_on_response_callback(self, response: str,
                                            resource: str = None, action: str = None, identifier: str = None):
-        await self._response_queue.put((resource, action, identifier, response))
+        self._deliver_response(response, resource, action, identifier)
 
     async def _client_on_image_callback(self, image: bytes,
                                         resource: str = None, action: str = None, identifier: str = None):
-        await self._response_queue.put((resource, action, identifier, image))
+        self._deliver_response(image, resource, action, identifier)
 
     async def _client_connection(self, websocket: websockets.WebSocketServerProtocol, _path: str):
         self.config.logger.debug("New connection")
 
+        if len(self._connections) >= self.config.max_connections:
+            # Connections admitted concurrently during the handshake may still exceed the maximum
+            self.config.logger.warning("Maximum number of %d connections reached, closing new connection" %
+                                       self.config.max_connections)
+            await websocket.close(code=1013, reason="Try again later")
+            return
+
         connection = OpenSongWsConnection(websocket, self.config)
         self._connections.append(connection)
 
-        await connection.run(self._client)
-        await websocket.close()
-
-        self._connections.remove(connection)
-
-    async def _receive_resource(self, endpoint: OpenSongEndpoint) -> Optional[HTTPResponse]:
-        while True:
-            response = await self._response_queue.get()
-            if response is not None:
-                resource, action, identifier, response_data = response
-                if endpoint.matches_endpoint(resource, action, identifier):
-                    if type(response_data) is str:
-                        headers = HTTPHeaders()
-                        if response_data[:5] == "<?xml":
-                            headers["Content-Type"] = "text/xml"
-                        return HTTPStatus.OK, headers, response_data.encode()
-                    elif type(response_data) is bytes:
-                        headers = HTTPHeaders()
-                        headers["Content-Type"] = "image/jpeg"
-                        return HTTPStatus.OK, headers, response_data
-                    else:
-                        break
-            else:
-                break
+        try:
+            await connection.run(self._client)
+            await websocket.close()
+        finally:
+            self._connections.remove(connection)
+            self.config.logger.debug("Connection closed, %d bytes held, %d messages dropped, %d connections open" %
+                                     (connection.memory_usage, connection.dropped_messages, len(self._connections)))
+
+    def memory_usage(self) -> int:
+        waiting_bytes = sum(data_size(response_future.result()) for _, response_future in self._waiting_requests
+                            if response_future.done() and not response_future.cancelled())
+        return waiting_bytes + sum(connection.memory_usage for connection in self._connections)
+
+    async def _receive_resource(self, response_future: asyncio.Future) -> Optional[HTTPResponse]:
+        response_data = await response_future
+
+        if type(response_data) is str:
+            headers = HTTPHeaders()
+            if response_data[:5] == "<?xml":
+                headers["Content-Type"] = "text/xml"
+            return HTTPStatus.OK, headers, response_data.encode()
+        elif type(response_data) is bytes:
+            headers = HTTPHeaders()
+            headers["Content-Type"] = "image/jpeg"
+            return HTTPStatus.OK, headers, response_data
 
         return None
 
+    def _open_connections(self) -> int:
+        return len(self._connections) + len(self._waiting_requests)
+
+    def _admit_connection(self) -> Optional[HTTPResponse]:
+        if self._admission.try_admit(self._open_connections()):
+            return None
+
+        self.config.logger.warning("Refused connection (%d open, %d refused in total, %d bytes held)" %
+                                   (self._open_connections(), self._admission.rejected_connections,
+                                    self.memory_usage()))
+        headers = HTTPHeaders()
+        headers["Retry-After"] = str(self._admission.retry_after())
+        return HTTPStatus.SERVICE_UNAVAILABLE, headers, bytes()
+
     async def _process_request(self, path: str, request_headers: HTTPHeaders) -> Optional[HTTPResponse]:
         if "Upgrade" not in request_headers:
+            refused = self._admit_connection()
+            if refused:
+                return refused
+
             endpoint = OpenSongEndpoint(url=path)
             if OpenSongWsConnection.resource_supported(endpoint) and not endpoint.resource == "ws":
                 print("Request", path)
-                if await self._client.request_resource(endpoint):
-                    response = await self._receive_resource(endpoint)
-                    if response:
-                        return response
+                # Wait for the response before requesting it, as a cached response is delivered right away
+                waiting_request = (endpoint, asyncio.get_event_loop().create_future())
+                self._waiting_requests.append(waiting_request)
+                try:
+                    if await self._client.request_resource(endpoint):
+                        response = await asyncio.wait_for(self._receive_resource(waiting_request[1]),
+                                                          self.config.request_timeout)
+                        if response:
+                            return response
+                        else:
+                            return HTTPStatus.INTERNAL_SERVER_ERROR, HTTPHeaders(), bytes()
                     else:
-                        return HTTPStatus.INTERNAL_SERVER_ERROR, HTTPHeaders(), bytes()
-                else:
-                    return HTTPStatus.NOT_IMPLEMENTED, HTTPHeaders(), bytes()
+                        return HTTPStatus.NOT_IMPLEMENTED, HTTPHeaders(), bytes()
+                except asyncio.TimeoutError:
+                    return HTTPStatus.GATEWAY_TIMEOUT, HTTPHeaders(), bytes()
+                finally:
+                    # Also on timeout, so a late response is neither kept nor served to a next request
+                    self._waiting_requests.remove(waiting_request)
         else:
-            return None
+            return self._admit_connection()
 
     def run(self):
         self._server = websockets.serve(ws_handler=self._client_connection, host=self.config.proxy_host,
-                                        port=self.config.proxy_port, process_request=self._process_request)
+                                        port=self.config.proxy_port, process_request=self._process_request,
+                                        # Heartbeats are disabled when the interval or timeout is None
+                                        ping_interval=self.config.ping_interval,
+                                        ping_timeout=self.config.ping_timeout,
+                                        max_size=self._max_message_size,
+                                        # Incoming messages received but not yet read by the connection
+                                        max_queue=self.config.max_queued_messages)
         return self._server
 
     def stop(self):
-        # await self._response_queue.put(None)
         for connection in self._connections:
             try:
                 connection.stop()
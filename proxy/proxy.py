@@ -16,6 +16,12 @@ def main():
                             help='Address of the OpenSong application')
     arg_parser.add_argument("--opensong-port", default=ProxyConfig.default_opensong_port, type=int,
                             help='Port of the OpenSong API server')
+    arg_parser.add_argument("--max-connections", default=ProxyConfig.default_max_connections, type=int,
+                            help='Maximum number of simultaneous client connections')
+    arg_parser.add_argument("--accept-rate", default=ProxyConfig.default_accept_rate, type=float,
+                            help='Number of new client connections accepted per second, 0 to disable')
+    arg_parser.add_argument("--idle-timeout", default=ProxyConfig.default_idle_timeout, type=int,
+                            help='Seconds after which an idle, unsubscribed client connection is closed, 0 to disable')
     args = arg_parser.parse_args()
 
     config = ProxyConfig()
@@ -28,6 +34,12 @@ def main():
         config.opensong_host = args.opensong_host
     if args.opensong_port and args.opensong_port is not ProxyConfig.default_opensong_port:
         config.opensong_port = args.opensong_port
+    if args.max_connections and args.max_connections != ProxyConfig.default_max_connections:
+        config.max_connections = args.max_connections
+    if args.accept_rate != ProxyConfig.default_accept_rate:
+        config.accept_rate = args.accept_rate
+    if args.idle_timeout != ProxyConfig.default_idle_timeout:
+        config.idle_timeout = args.idle_timeout or None
 
     client = OpenSongWsClient(config)
     server = OpenSongWsServer(config, client)
@@ -1,5 +1,6 @@
 import os
 import logging
+from typing import Optional
 
 
 class ProxyConfig:
@@ -7,6 +8,16 @@ class ProxyConfig:
     default_proxy_port = 8082
     default_opensong_host = 'opensong'
     default_opensong_port = 8082
+    default_max_connections = 100
+    default_accept_rate = 10
+    default_accept_burst = 20
+    default_max_pending_requests = 4
+    default_request_timeout = 10
+    default_max_queued_messages = 8
+    default_max_buffered_bytes = 4 * 1024 * 1024
+    default_idle_timeout = 300
+    default_ping_interval = 20
+    default_ping_timeout = 20
 
     def __init__(self):
         self.proxy_host = os.getenv("PROXY_HOST", self.default_proxy_host)
@@ -14,6 +25,19 @@ class ProxyConfig:
         self.opensong_host = os.getenv("OPENSONG_HOST", self.default_opensong_host)
         self.opensong_port = os.getenv("OPENSONG_PORT", self.default_opensong_port)
 
+        # Admission control and eviction of client connections
+        self.max_connections = int(os.getenv("PROXY_MAX_CONNECTIONS", self.default_max_connections))
+        # An accept rate of 0 or an empty value disables rate limiting
+        self.accept_rate = float(os.getenv("PROXY_ACCEPT_RATE", self.default_accept_rate) or 0)
+        self.accept_burst = int(os.getenv("PROXY_ACCEPT_BURST", self.default_accept_burst))
+        self.max_pending_requests = int(os.getenv("PROXY_MAX_PENDING_REQUESTS", self.default_max_pending_requests))
+        self.max_queued_messages = int(os.getenv("PROXY_MAX_QUEUED_MESSAGES", self.default_max_queued_messages))
+        self.request_timeout = int(os.getenv("PROXY_REQUEST_TIMEOUT", self.default_request_timeout))
+        self.max_buffered_bytes = int(os.getenv("PROXY_MAX_BUFFERED_BYTES", self.default_max_buffered_bytes))
+        self.idle_timeout = self._optional_seconds("PROXY_IDLE_TIMEOUT", self.default_idle_timeout)
+        self.ping_interval = self._optional_seconds("PROXY_PING_INTERVAL", self.default_ping_interval)
+        self.ping_timeout = self._optional_seconds("PROXY_PING_TIMEOUT", self.default_ping_timeout)
+
         self.logger = logging.getLogger("OpenSongWsProxy")
         self.logger.setLevel(logging.DEBUG)
 
@@ -22,3 +46,9 @@ class ProxyConfig:
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         handler.setFormatter(formatter)
         self.logger.addHandler(handler)
+
+    @staticmethod
+    def _optional_seconds(name: str, default: int) -> Optional[int]:
+        # A value of 0 or an empty value disables the timeout or interval
+        value = os.getenv(name, str(default))
+        return (int(value) or None) if value else None
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from proxy.proxyconfig import ProxyConfig
+from proxy.opensongendpoint import OpenSongEndpoint
+
+
+class FakeWebsocket:
+    def __init__(self, block_send: bool = False):
+        self.messages = asyncio.Queue()
+        self.sent = []
+        self.close_code = None
+        self.fail_send = False
+        self._send_allowed = asyncio.Event()
+        if not block_send:
+            self._send_allowed.set()
+
+    def release_send(self):
+        self._send_allowed.set()
+
+    async def recv(self):
+        return await self.messages.get()
+
+    async def send(self, data):
+        await self._send_allowed.wait()
+        if self.fail_send:
+            raise ConnectionError("client disconnected")
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.close_code = code
+
+
+class FakeClient:
+    def __init__(self):
+        self.requested = []
+        self.fail_register = False
+
+    def register_response_callback(self, _callback):
+        if self.fail_register:
+            raise RuntimeError("register failed")
+
+    def unregister_response_callback(self, _callback):
+        pass
+
+    def register_image_callback(self, _callback):
+        pass
+
+    def unregister_image_callback(self, _callback):
+        pass
+
+    async def request_resource(self, endpoint: OpenSongEndpoint) -> bool:
+        # Accept the request, the response is never delivered unless a test does so
+        self.requested.append(endpoint.url)
+        return True
+
+
+@pytest.fixture
+def config():
+    return ProxyConfig()
+
+
+@pytest.fixture
+def fake_websocket():
+    # Factory, as the fake must be created within the event loop of the test
+    return FakeWebsocket
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient
@@ -0,0 +1,40 @@
+from proxy.opensongadmission import OpenSongAdmission
+
+
+def test_admission_max_connections():
+    admission = OpenSongAdmission(max_connections=2, accept_rate=10, accept_burst=10, full_retry_after=75, now=0)
+    assert admission.try_admit(0, now=0)
+    assert admission.try_admit(1, now=0)
+    assert not admission.try_admit(2, now=0)
+    assert admission.rejected_connections == 1
+    assert admission.refused_reason == OpenSongAdmission.refused_max_connections
+    assert admission.retry_after() == 75
+
+
+def test_admission_accept_burst():
+    admission = OpenSongAdmission(max_connections=100, accept_rate=1, accept_burst=3, now=0)
+    assert admission.try_admit(0, now=0)
+    assert admission.try_admit(1, now=0)
+    assert admission.try_admit(2, now=0)
+    assert not admission.try_admit(3, now=0)
+    assert admission.refused_reason == OpenSongAdmission.refused_accept_rate
+    assert admission.retry_after() == 1
+
+
+def test_admission_accept_rate():
+    admission = OpenSongAdmission(max_connections=100, accept_rate=2, accept_burst=1, now=0)
+    assert admission.try_admit(0, now=0)
+    assert not admission.try_admit(1, now=0.1)
+    assert admission.try_admit(1, now=0.6)
+    assert not admission.try_admit(2, now=0.6)
+    # Refill does not exceed the burst size
+    assert admission.try_admit(2, now=100)
+    assert not admission.try_admit(3, now=100)
+
+
+def test_admission_accept_rate_disabled():
+    admission = OpenSongAdmission(max_connections=100, accept_rate=0, accept_burst=1, now=0)
+    for active_connections in range(10):
+        assert admission.try_admit(active_connections, now=0)
+    assert not admission.try_admit(100, now=0)
+    assert admission.refused_reason == OpenSongAdmission.refused_max_connections
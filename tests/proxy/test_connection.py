@@ -0,0 +1,165 @@
+import asyncio
+import time
+from proxy.opensongwsconnection import OpenSongWsConnection
+
+
+def test_connection_pending_request_cap(config, fake_websocket, fake_client):
+    config.max_pending_requests = 2
+
+    async def _test():
+        websocket = fake_websocket()
+        client = fake_client()
+        connection = OpenSongWsConnection(websocket, config)
+
+        await connection.process_request("/presentation/status", client)
+        await connection.process_request("/song/list", client)
+        await connection.process_request("/set/list", client)
+        await asyncio.sleep(0)
+
+        assert client.requested == ["/presentation/status", "/song/list"]
+        assert websocket.sent == ["Too many pending requests"]
+        assert connection.pending_requests == 2
+        assert connection.pending_request_bytes == len("/presentation/status") + len("/song/list")
+
+        # Delivering a response frees its slot and accounting
+        await connection._client_on_response_callback(websocket, "<?xml status", "presentation", "status")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert websocket.sent[-1] == "<?xml status"
+        assert connection.pending_requests == 1
+        assert connection.pending_request_bytes == len("/song/list")
+
+        await connection.process_request("/set/list", client)
+        assert client.requested[-1] == "/set/list"
+        assert connection.pending_requests == 2
+
+    asyncio.run(_test())
+
+
+def test_connection_pending_request_timeout(config, fake_websocket, fake_client):
+    config.request_timeout = 0.05
+
+    async def _test():
+        websocket = fake_websocket()
+        connection = OpenSongWsConnection(websocket, config)
+
+        await connection.process_request("/song/list", fake_client())
+        await connection.process_request("/set/list", fake_client())
+        assert connection.pending_requests == 2
+
+        # A delivered response cancels the expiry of its request
+        await connection._client_on_response_callback(websocket, "<?xml set", "set", "list")
+
+        # Without any further activity on the connection, the other request expires
+        await asyncio.sleep(0.1)
+        assert connection.pending_requests == 0
+        assert connection.pending_request_bytes == 0
+        assert websocket.sent == ["<?xml set", "The requested resource did not respond"]
+
+        # A late response is ignored
+        await connection._client_on_response_callback(websocket, "<?xml list", "song", "list")
+        await asyncio.sleep(0)
+        assert websocket.sent == ["<?xml set", "The requested resource did not respond"]
+
+    asyncio.run(_test())
+
+
+def test_connection_idle_eviction(config, fake_websocket, fake_client):
+    config.idle_timeout = 0.05
+
+    async def _test():
+        connection = OpenSongWsConnection(fake_websocket(), config)
+        await asyncio.wait_for(connection.run(fake_client()), 1)
+
+    asyncio.run(_test())
+
+
+def test_connection_subscribed_not_evicted(config, fake_websocket, fake_client):
+    config.idle_timeout = 0.05
+
+    async def _test():
+        websocket = fake_websocket()
+        connection = OpenSongWsConnection(websocket, config)
+        websocket.messages.put_nowait("/ws/subscribe/presentation")
+
+        def _stop():
+            connection.stop()
+            websocket.messages.put_nowait("")
+
+        start = time.monotonic()
+        asyncio.get_event_loop().call_later(0.3, _stop)
+        await asyncio.wait_for(connection.run(fake_client()), 1)
+
+        assert time.monotonic() - start >= 0.3
+        assert websocket.sent == ["OK"]
+
+    asyncio.run(_test())
+
+
+def test_connection_forward_accounting(config, fake_websocket):
+    config.max_buffered_bytes = 10
+
+    async def _test():
+        websocket = fake_websocket(block_send=True)
+        connection = OpenSongWsConnection(websocket, config)
+
+        # A message larger than the buffer is allowed when nothing is buffered
+        connection._forward(websocket, "0123456789abc")
+        assert connection.buffered_bytes == 13
+        assert connection.memory_usage == 13
+
+        # Broadcasts are dropped while the buffer is full
+        connection._forward(websocket, "status", broadcast=True)
+        assert connection.dropped_messages == 1
+        assert connection.buffered_bytes == 13
+        assert websocket.close_code is None
+
+        websocket.release_send()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert websocket.sent == ["0123456789abc"]
+        assert connection.buffered_bytes == 0
+
+    asyncio.run(_test())
+
+
+def test_connection_forward_closes_slow_client(config, fake_websocket):
+    config.max_buffered_bytes = 10
+
+    async def _test():
+        websocket = fake_websocket(block_send=True)
+        connection = OpenSongWsConnection(websocket, config)
+
+        connection._forward(websocket, "01234567")
+        connection._forward(websocket, "response")
+        await asyncio.sleep(0)
+
+        assert connection.dropped_messages == 1
+        assert connection.buffered_bytes == 8
+        assert websocket.close_code == 1013
+
+    asyncio.run(_test())
+
+
+def test_connection_forward_encoded_size(config, fake_websocket):
+    async def _test():
+        websocket = fake_websocket(block_send=True)
+        connection = OpenSongWsConnection(websocket, config)
+
+        connection._forward(websocket, "Ére zij God")
+        assert connection.buffered_bytes == len("Ére zij God".encode())
+
+        # A failed send is retrieved and still releases its accounting
+        websocket.fail_send = True
+        websocket.release_send()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert connection.buffered_bytes == 0
+
+    loop = asyncio.new_event_loop()
+    exceptions = []
+    loop.set_exception_handler(lambda _loop, context: exceptions.append(context))
+    loop.run_until_complete(_test())
+    loop.close()
+    assert exceptions == []
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from http import HTTPStatus
+from websockets.http import Headers as HTTPHeaders
+from proxy.opensongwsserver import OpenSongWsServer
+from proxy.opensongwsconnection import OpenSongWsConnection
+
+
+def test_server_closes_connection_over_limit(config, fake_websocket, fake_client):
+    config.max_connections = 1
+
+    async def _test():
+        server = OpenSongWsServer(config, fake_client())
+        server._connections.append(OpenSongWsConnection(fake_websocket(), config))
+
+        websocket = fake_websocket()
+        await server._client_connection(websocket, "/")
+
+        assert websocket.close_code == 1013
+        assert len(server._connections) == 1
+
+    asyncio.run(_test())
+
+
+def test_server_removes_failed_connection(config, fake_websocket, fake_client):
+    async def _test():
+        client = fake_client()
+        server = OpenSongWsServer(config, client)
+        client.fail_register = True
+
+        with pytest.raises(RuntimeError):
+            await server._client_connection(fake_websocket(), "/")
+
+        assert server._connections == []
+
+    asyncio.run(_test())
+
+
+def test_server_refuses_http_request_over_limit(config, fake_client):
+    config.max_connections = 0
+
+    async def _test():
+        server = OpenSongWsServer(config, fake_client())
+        status, headers, _ = await server._process_request("/presentation/status", HTTPHeaders())
+
+        assert status == HTTPStatus.SERVICE_UNAVAILABLE
+        assert int(headers["Retry-After"]) >= 30
+
+    asyncio.run(_test())
+
+
+def test_server_http_request_timeout(config, fake_client):
+    config.request_timeout = 0.05
+
+    async def _test():
+        server = OpenSongWsServer(config, fake_client())
+        status, _, _ = await server._process_request("/presentation/status", HTTPHeaders())
+
+        assert status == HTTPStatus.GATEWAY_TIMEOUT
+        assert server._open_connections() == 0
+
+    asyncio.run(_test())
+
+
+def test_server_http_response_not_kept(config, fake_client):
+    config.request_timeout = 0.05
+
+    async def _test():
+        server = OpenSongWsServer(config, fake_client())
+
+        # Responses are not retained without an HTTP request waiting for them
+        await server._client_on_image_callback(bytes(100), "presentation", "slide", "1")
+        assert server.memory_usage() == 0
+
+        status, _, _ = await server._process_request("/presentation/status", HTTPHeaders())
+        assert status == HTTPStatus.GATEWAY_TIMEOUT
+
+        # A late response is not served to a next request
+        await server._client_on_response_callback("<?xml late", "presentation", "status")
+        request = asyncio.ensure_future(server._process_request("/presentation/status", HTTPHeaders()))
+        await asyncio.sleep(0)
+
+        await server._client_on_response_callback("<?xml current", "presentation", "status")
+        assert server.memory_usage() == len("<?xml current")
+
+        status, _, body = await request
+        assert status == HTTPStatus.OK
+        assert body == b"<?xml current"
+        assert server.memory_usage() == 0
+
+    asyncio.run(_test())